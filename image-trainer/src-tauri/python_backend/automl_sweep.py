@@ -105,6 +105,7 @@ def build_dataloaders(data_dir, batch_size, num_workers):
 
 def run_trial_training(model, dataloaders, dataset_sizes, device, optimizer, criterion, epochs):
     """Run a short training and return best validation accuracy."""
+    import model_factory
     best_acc = 0.0
 
     for epoch in range(epochs):
@@ -126,9 +127,10 @@ def run_trial_training(model, dataloaders, dataset_sizes, device, optimizer, cri
 
                 optimizer.zero_grad()
                 with torch.set_grad_enabled(phase == 'train'):
-                    outputs = model(inputs)
-                    _, preds = torch.max(outputs, 1)
-                    loss = criterion(outputs, labels)
+                    with model_factory.amp_context(device):
+                        outputs = model(inputs)
+                        _, preds = torch.max(outputs, 1)
+                        loss = criterion(outputs, labels)
                     if phase == 'train':
                         loss.backward()
                         optimizer.step()
@@ -208,12 +210,19 @@ def main():
             model, params_to_optimize = model_factory.create_model(args.model, num_classes, device)
 
             # Create optimizer
+            opt_kwargs = {'lr': lr}
             if optimizer_name == "SGD":
-                opt = optim.SGD(params_to_optimize, lr=lr, momentum=0.9)
+                opt_cls = optim.SGD
+                opt_kwargs['momentum'] = 0.9
             elif optimizer_name == "Adam":
-                opt = optim.Adam(params_to_optimize, lr=lr)
+                opt_cls = optim.Adam
             else:  # AdamW
-                opt = optim.AdamW(params_to_optimize, lr=lr)
+                opt_cls = optim.AdamW
+            try:
+                # Fused optimizers step all CUDA parameters in one kernel launch.
+                opt = opt_cls(params_to_optimize, fused=device.type == 'cuda', **opt_kwargs)
+            except (TypeError, RuntimeError):
+                opt = opt_cls(params_to_optimize, **opt_kwargs)
 
             criterion = nn.CrossEntropyLoss()
 
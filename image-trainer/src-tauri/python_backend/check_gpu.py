@@ -1,9 +1,32 @@
-import torch
+import importlib
+import os
 import sys
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dumps(obj):
+    # orjson serializes several times faster; stdlib json is the fallback.
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+def _torch():
+    # Importing torch costs ~1-2s of CUDA/driver probing; defer it so the
+    # module stays cheap to import and the cost is only paid when queried.
+    return importlib.import_module("torch")
+
 def get_gpu_info() -> dict:
-    cuda_available = torch.cuda.is_available()
+    torch = _torch()
+    # An explicitly empty CUDA_VISIBLE_DEVICES means "no GPU wanted";
+    # skip the device probe entirely instead of asking the driver.
+    if os.environ.get("CUDA_VISIBLE_DEVICES") == "":
+        cuda_available = False
+    else:
+        cuda_available = torch.cuda.is_available()
 
     info = {
         "python_version": sys.version.split(" ")[0],
@@ -17,4 +40,4 @@ def get_gpu_info() -> dict:
     return info
 
 if __name__ == "__main__":
-    print(json.dumps(get_gpu_info()))
+    print(_dumps(get_gpu_info()))
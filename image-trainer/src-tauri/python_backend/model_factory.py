@@ -1,3 +1,11 @@
+import collections
+import contextlib
+import functools
+import math
+import os
+from types import MappingProxyType
+from urllib.parse import urlparse
+
 import torch
 import torch.nn as nn
 import torchvision
@@ -8,152 +16,339 @@ from torchvision.models import (
 )
 
 # --- Custom Blocks ---
+
+def _deform_fwd(x, offset_weight, offset_bias, weight, bias, stride, padding):
+    """Offset conv + deformable conv as one compilable free function."""
+    offset = nn.functional.conv2d(x, offset_weight, offset_bias, stride=stride, padding=padding)
+    return torchvision.ops.deform_conv2d(x, offset, weight, bias, stride=stride, padding=padding)
+
+# One compiled forward shared by every DeformableBlock: a per-instance
+# compile would give dynamo 12+ frames over the same code object and blow
+# through its recompile limit during construction. Compiled lazily on the
+# first forward, so the single compile covers the device/layout/dtype
+# training actually uses; dynamic=True keeps batch-size changes (e.g. the
+# final partial batch) from triggering fresh compiles.
+_compiled_deform_fwd = None
+_deform_compile_failed = not hasattr(torch, 'compile')
+
 class DeformableBlock(nn.Module):
     def __init__(self, in_channels, out_channels, kernel_size=3, stride=1, padding=1, groups=1, bias=False):
         super().__init__()
-        self.offset_conv = nn.Conv2d(in_channels, 2 * kernel_size * kernel_size, kernel_size=kernel_size, stride=stride, padding=padding, bias=True)
-        nn.init.constant_(self.offset_conv.weight, 0)
-        nn.init.constant_(self.offset_conv.bias, 0)
-        
-        self.dcn = torchvision.ops.DeformConv2d(in_channels, out_channels, kernel_size=kernel_size, stride=stride, padding=padding, groups=groups, bias=bias)
-        
+        # skip_init bypasses Conv2d's default Kaiming fill (which would be
+        # overwritten immediately), so the offset params are written once.
+        self.offset_conv = nn.utils.skip_init(
+            nn.Conv2d, in_channels, 2 * kernel_size * kernel_size,
+            kernel_size=kernel_size, stride=stride, padding=padding, bias=True)
+        with torch.no_grad():
+            self.offset_conv.weight.zero_()
+            self.offset_conv.bias.zero_()
+
+        # Bare parameters + the functional op skip the DeformConv2d module
+        # indirection, leaving Inductor a single graph to fuse the offset
+        # conv epilogue into the deform-conv gather. Init matches
+        # DeformConv2d.reset_parameters.
+        self.stride = stride
+        self.padding = padding
+        self.weight = nn.Parameter(torch.empty(out_channels, in_channels // groups, kernel_size, kernel_size))
+        nn.init.kaiming_uniform_(self.weight, a=math.sqrt(5))
+        if bias:
+            self.bias = nn.Parameter(torch.empty(out_channels))
+            fan_in, _ = nn.init._calculate_fan_in_and_fan_out(self.weight)
+            nn.init.uniform_(self.bias, -1 / math.sqrt(fan_in), 1 / math.sqrt(fan_in))
+        else:
+            self.register_parameter('bias', None)
+
+        if not hasattr(torch, 'compile'):
+            # Eager-only torch: TorchScript at least the offset conv so its
+            # Python dispatch overhead is gone. Not done when torch.compile
+            # exists, where a ScriptModule would only force a graph break.
+            # The dummy forward warms the script's profiling/fusion passes
+            # here rather than on the first training batch.
+            try:
+                scripted = torch.jit.script(self.offset_conv)
+                with torch.no_grad():
+                    scripted(torch.zeros(1, in_channels, 32, 32))
+                self.offset_conv = scripted
+            except Exception:
+                pass
+
+    def _raw_forward(self, x):
+        return torchvision.ops.deform_conv2d(
+            x, self.offset_conv(x), self.weight, self.bias,
+            stride=self.stride, padding=self.padding)
+
     def forward(self, x):
-        offset = self.offset_conv(x)
-        return self.dcn(x, offset)
+        global _compiled_deform_fwd, _deform_compile_failed
+        if not _deform_compile_failed:
+            if _compiled_deform_fwd is None:
+                _compiled_deform_fwd = torch.compile(
+                    _deform_fwd, mode="reduce-overhead", fullgraph=False, dynamic=True)
+            try:
+                return _compiled_deform_fwd(
+                    x, self.offset_conv.weight, self.offset_conv.bias,
+                    self.weight, self.bias, self.stride, self.padding)
+            except Exception:
+                # Backend errors (e.g. no working C++ toolchain) surface at
+                # the first call; run eager from then on.
+                _deform_compile_failed = True
+        return self._raw_forward(x)
 
 def _replace_layers_with_dcn(model):
     """
     Replaces 3x3 convolutions in late layers (layer2, layer3, layer4) with Deformable Convs
     """
-    layers_to_modify = ['layer2', 'layer3', 'layer4']
-    for layer_name in layers_to_modify:
-        layer = getattr(model, layer_name)
-        for i, block in enumerate(layer.children()):
-            if hasattr(block, 'conv1') and block.conv1.kernel_size == (3, 3):
-                new_conv = DeformableBlock(
-                    block.conv1.in_channels, 
-                    block.conv1.out_channels, 
-                    kernel_size=3, 
-                    stride=block.conv1.stride, 
-                    padding=block.conv1.padding, 
-                    bias=False
-                )
-                # Copy standard weights
-                new_conv.dcn.weight.data = block.conv1.weight.data
-                block.conv1 = new_conv
-                
-            if hasattr(block, 'conv2') and block.conv2.kernel_size == (3, 3):
-                new_conv = DeformableBlock(
-                    block.conv2.in_channels, 
-                    block.conv2.out_channels, 
-                    kernel_size=3, 
-                    stride=block.conv2.stride, 
-                    padding=block.conv2.padding, 
-                    bias=False
-                )
-                new_conv.dcn.weight.data = block.conv2.weight.data
-                block.conv2 = new_conv
+    layers_to_modify = {'layer2', 'layer3', 'layer4'}
+
+    # Collect first, replace second: mutating modules while named_modules()
+    # is still iterating would invalidate the traversal. The name->module
+    # mapping doubles as the parent lookup, so no getattr chains are walked.
+    modules = dict(model.named_modules())
+    to_replace = []
+    for name, module in modules.items():
+        if (isinstance(module, nn.Conv2d)
+                and module.kernel_size == (3, 3)
+                and name.split('.')[0] in layers_to_modify):
+            path, _, attr = name.rpartition('.')
+            to_replace.append((modules[path], attr, module))
+
+    for parent, attr, old_conv in to_replace:
+        new_conv = DeformableBlock(
+            old_conv.in_channels,
+            old_conv.out_channels,
+            kernel_size=3,
+            stride=old_conv.stride,
+            padding=old_conv.padding,
+            bias=False
+        )
+        # Copy standard weights
+        new_conv.weight = nn.Parameter(old_conv.weight.detach().clone())
+        setattr(parent, attr, new_conv)
 
 # --- Model Factory ---
 
 # import timm (Moved to local scope to avoid startup errors if missing)
 
+# Built once at import; the read-only proxy keeps callers from mutating
+# the shared mapping.
+_AVAILABLE_MODELS = MappingProxyType({
+    'resnet18': 'ResNet18 (Standard)',
+    'resnet50': 'ResNet50 (Deep)',
+    'efficientnet_b0': 'EfficientNet-B0 (Efficient)',
+    'dcn': 'Deformable CNN (Advanced)',
+    'eva02': 'EVA-02 ViT (Transformer)',
+    'mobilenet_v3': 'MobileNetV3 (Mobile)',
+    'vit_b_16': 'ViT-B/16 (Vision Transformer)',
+    'convnext': 'ConvNeXt (Modern ConvNet)'
+})
+
 def get_available_models():
-    return {
-        'resnet18': 'ResNet18 (Standard)',
-        'resnet50': 'ResNet50 (Deep)',
-        'efficientnet_b0': 'EfficientNet-B0 (Efficient)',
-        'dcn': 'Deformable CNN (Advanced)',
-        'eva02': 'EVA-02 ViT (Transformer)',
-        'mobilenet_v3': 'MobileNetV3 (Mobile)',
-        'vit_b_16': 'ViT-B/16 (Vision Transformer)',
-        'convnext': 'ConvNeXt (Modern ConvNet)'
-    }
+    return _AVAILABLE_MODELS
 
-def create_model(model_name, num_classes, device):
-    print(f"[Model Factory] Initializing {model_name}...", flush=True)
-    
-    model = None
-    
-    # 1. Base Model Creation & Configuration
+# Constructor + pretrained weights per torchvision model.
+# 'dcn' builds on the resnet18 entry, 'eva02' comes from timm (see below).
+_TORCHVISION_MODELS = {
+    'resnet18': (models.resnet18, ResNet18_Weights.DEFAULT),
+    'resnet50': (models.resnet50, ResNet50_Weights.DEFAULT),
+    'efficientnet_b0': (models.efficientnet_b0, EfficientNet_B0_Weights.DEFAULT),
+    'mobilenet_v3': (models.mobilenet_v3_large, MobileNet_V3_Large_Weights.DEFAULT),
+    'vit_b_16': (models.vit_b_16, ViT_B_16_Weights.DEFAULT),
+    'convnext': (models.convnext_tiny, ConvNeXt_Tiny_Weights.DEFAULT),
+}
+
+# Conv-family models benefit from NHWC layouts on Tensor Cores;
+# the pure-transformer models (vit_b_16, eva02) don't.
+_CHANNELS_LAST_MODELS = {'resnet18', 'resnet50', 'efficientnet_b0', 'dcn', 'mobilenet_v3', 'convnext'}
+
+def amp_context(device):
+    """
+    Returns the autocast context training loops should run forwards under.
+
+    Uses bf16 autocast on CUDA devices that support it (same range as fp32,
+    so no GradScaler is needed); everywhere else it's a no-op context.
+    """
+    if (torch.device(device).type == 'cuda'
+            and torch.cuda.is_available()
+            and torch.cuda.is_bf16_supported()):
+        return torch.autocast(device_type='cuda', dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+def _build_arch(model_name):
+    """Constructs the bare architecture skeleton without loading any weights."""
     if model_name == 'dcn':
         # DCN uses ResNet18 as base
-        model = models.resnet18(weights=ResNet18_Weights.DEFAULT)
-        print("[Model Factory] Applying Deformable Convolutions...", flush=True)
-        _replace_layers_with_dcn(model)
-        
-    elif model_name == 'resnet18':
-        model = models.resnet18(weights=ResNet18_Weights.DEFAULT)
-        
-    elif model_name == 'resnet50':
-        model = models.resnet50(weights=ResNet50_Weights.DEFAULT)
-        
-    elif model_name == 'efficientnet_b0':
-        model = models.efficientnet_b0(weights=EfficientNet_B0_Weights.DEFAULT)
-        
-    elif model_name == 'eva02':
+        return models.resnet18(weights=None)
+    if model_name == 'eva02':
         # Using EVA-02 Base Patch14 224
         # Note: Requires timm installed
-        print("[Model Factory] Loading EVA-02 from timm...", flush=True)
         import timm
-        try:
-            model = timm.create_model('eva02_base_patch14_224.mim_in22k_ft_in1k', pretrained=True)
-        except Exception:
-            # Fallback if specific tag fails or newer timm version
-            print("[Model Factory] Specific EVA-02 tag failed, trying generic 'eva02_base_patch14_224'...", flush=True)
-            model = timm.create_model('eva02_base_patch14_224', pretrained=True)
+        # Build the exact variant the cached weights resolved to: the tagged
+        # and untagged names can carry different heads (the untagged default
+        # is the headless mim_in22k config), and the strict state_dict load
+        # in create_model needs arch and weights to agree.
+        resolved_name, _ = _load_eva02()
+        return timm.create_model(resolved_name, pretrained=False)
+    constructor, _ = _TORCHVISION_MODELS[model_name]
+    return constructor(weights=None)
 
-    elif model_name == 'mobilenet_v3':
-        model = models.mobilenet_v3_large(weights=MobileNet_V3_Large_Weights.DEFAULT)
+@functools.lru_cache(maxsize=1)
+def _load_eva02():
+    """Returns (resolved timm model name, template state_dict) for EVA-02."""
+    print("[Model Factory] Loading EVA-02 from timm...", flush=True)
+    import timm
+    try:
+        name = 'eva02_base_patch14_224.mim_in22k_ft_in1k'
+        template = timm.create_model(name, pretrained=True)
+    except Exception:
+        # Fallback if specific tag fails or newer timm version
+        print("[Model Factory] Specific EVA-02 tag failed, trying generic 'eva02_base_patch14_224'...", flush=True)
+        name = 'eva02_base_patch14_224'
+        template = timm.create_model(name, pretrained=True)
+    return name, template.state_dict()
 
-    elif model_name == 'vit_b_16':
-        model = models.vit_b_16(weights=ViT_B_16_Weights.DEFAULT)
+def _eva02_cache_present():
+    """True when the EVA-02 weights already sit in the local HF hub cache."""
+    hf_home = os.environ.get('HF_HOME')
+    cache_dir = os.path.join(hf_home, 'hub') if hf_home else os.path.expanduser('~/.cache/huggingface/hub')
+    try:
+        return any('eva02_base_patch14_224' in entry for entry in os.listdir(cache_dir))
+    except OSError:
+        return False
 
-    elif model_name == 'convnext':
-        model = models.convnext_tiny(weights=ConvNeXt_Tiny_Weights.DEFAULT)
+@functools.lru_cache(maxsize=None)
+def _load_weights(model_name):
+    """
+    Returns a CPU-resident template state_dict for model_name.
 
-    else:
+    Cached per process, so hyperparameter sweeps / repeated instantiations
+    pay the weight-file read (and the timm hub check for eva02) only once.
+    """
+    if model_name == 'dcn':
+        return _load_weights('resnet18')
+    if model_name == 'eva02':
+        _, state_dict = _load_eva02()
+        return state_dict
+    _, weights = _TORCHVISION_MODELS[model_name]
+    # When the checkpoint is already in the hub cache, torch.load it with
+    # mmap so pages fault in lazily instead of the whole ~100MB file being
+    # pulled into RSS up front; weights_only avoids the pickle machinery.
+    cached = os.path.join(torch.hub.get_dir(), 'checkpoints',
+                          os.path.basename(urlparse(weights.url).path))
+    if os.path.isfile(cached):
+        try:
+            return torch.load(cached, map_location='cpu', mmap=True, weights_only=True)
+        except (TypeError, RuntimeError):
+            # Older torch without mmap/weights_only support
+            pass
+    return weights.get_state_dict(progress=True)
+
+# Classifier-head accessors per model: (get head, set head). EfficientNet and
+# friends keep their Dropout-wrapped classifiers; only the Linear is swapped.
+# The default covers the ResNet-style .fc attribute; eva02 goes through
+# timm's reset_classifier instead (see create_model).
+_HEADS = {
+    'efficientnet_b0': (lambda m: m.classifier[1],
+                        lambda m, head: m.classifier.__setitem__(1, head)),
+    'mobilenet_v3': (lambda m: m.classifier[3],
+                     lambda m, head: m.classifier.__setitem__(3, head)),
+    'vit_b_16': (lambda m: m.heads.head,
+                 lambda m, head: setattr(m.heads, 'head', head)),
+    'convnext': (lambda m: m.classifier[2],
+                 lambda m, head: m.classifier.__setitem__(2, head)),
+}
+_DEFAULT_HEAD = (lambda m: m.fc, lambda m, head: setattr(m, 'fc', head))
+
+def create_model(model_name, num_classes, device):
+    print(f"[Model Factory] Initializing {model_name}...", flush=True)
+
+    if model_name not in get_available_models():
         raise ValueError(f"Unknown model name: {model_name}")
 
+    if (model_name == 'eva02' and 'HF_HUB_OFFLINE' not in os.environ
+            and _eva02_cache_present()):
+        # With the weights already in the local hub cache, going offline
+        # skips the HTTP freshness check timm would otherwise make.
+        # huggingface_hub freezes this flag into its constants when first
+        # imported — which the `import timm` in _build_arch triggers — so
+        # it must be set here, before any timm import runs.
+        os.environ['HF_HUB_OFFLINE'] = '1'
+
+    # 1. Base Model Creation & Configuration
+    model = _build_arch(model_name)
+
+    # Clone the cached template so training never mutates the shared copy.
+    # assign=True (PyTorch >= 2.1) adopts the tensors directly instead of
+    # copying them into the skeleton's freshly-initialized parameters.
+    state_dict = {k: v.clone() for k, v in _load_weights(model_name).items()}
+    try:
+        model.load_state_dict(state_dict, assign=True)
+    except TypeError:
+        model.load_state_dict(state_dict)
+
+    if model_name == 'dcn':
+        # Let cuDNN autotune so it picks NHWC-friendly algorithms for the
+        # replaced convs (Tensor Cores prefer channels-last layouts).
+        torch.backends.cudnn.benchmark = True
+        print("[Model Factory] Applying Deformable Convolutions...", flush=True)
+        _replace_layers_with_dcn(model)
+        model = model.to(memory_format=torch.channels_last)
+
     # 2. Freezing Strategy (Transfer Learning)
     # Freeze all parameters initially
-    for param in model.parameters():
-        param.requires_grad = False
-        
+    model.requires_grad_(False)
+
     # Unfreeze specific layers based on model type
     if model_name == 'dcn':
         # Unfreeze DCN layers
-        for name, module in model.named_modules():
+        for module in model.modules():
             if isinstance(module, DeformableBlock):
-                for param in module.parameters():
-                    param.requires_grad = True
+                module.requires_grad_(True)
     
     # 3. Final Layer Modification (always trainable)
     if model_name == 'eva02':
         # timm helper to reset head to num_classes
         model.reset_classifier(num_classes)
-    elif model_name == 'efficientnet_b0':
-        # EfficientNet uses a classifier with Dropout
-        num_ftrs = model.classifier[1].in_features
-        model.classifier[1] = nn.Linear(num_ftrs, num_classes)
-    elif model_name == 'mobilenet_v3':
-        num_ftrs = model.classifier[3].in_features
-        model.classifier[3] = nn.Linear(num_ftrs, num_classes)
-    elif model_name == 'vit_b_16':
-        num_ftrs = model.heads.head.in_features
-        model.heads.head = nn.Linear(num_ftrs, num_classes)
-    elif model_name == 'convnext':
-        num_ftrs = model.classifier[2].in_features
-        model.classifier[2] = nn.Linear(num_ftrs, num_classes)
     else:
-        # Standard ResNet approach
-        num_ftrs = model.fc.in_features
-        model.fc = nn.Linear(num_ftrs, num_classes)
+        getter, setter = _HEADS.get(model_name, _DEFAULT_HEAD)
+        setter(model, nn.Linear(getter(model).in_features, num_classes))
 
     # 4. Move to Device
     model = model.to(device)
-    
-    # 5. Return model and optimized parameters
-    parameters_to_optimize = [p for p in model.parameters() if p.requires_grad]
-    
+    if torch.device(device).type == 'cuda':
+        if model_name in _CHANNELS_LAST_MODELS:
+            model = model.to(memory_format=torch.channels_last)
+            memory_format = torch.channels_last
+        else:
+            memory_format = torch.contiguous_format
+
+        # Warm the cuDNN autotuner at the 224x224 training resolution so the
+        # first real batch doesn't pay the per-shape algorithm search. Runs
+        # under amp_context so the benchmarked algorithms cover the same
+        # bf16 shapes real training uses. TF32 matmuls help the transformer
+        # models on Ampere and newer.
+        torch.backends.cudnn.benchmark = True
+        torch.backends.cuda.matmul.allow_tf32 = True
+        try:
+            dummy = torch.zeros(1, 3, 224, 224, device=device).to(memory_format=memory_format)
+            was_training = model.training
+            model.eval()
+            with torch.no_grad(), amp_context(device):
+                model(dummy)
+            model.train(was_training)
+        except Exception as e:
+            # Warmup is purely an optimization; never fail model creation,
+            # but do say why it was skipped.
+            print(f"[Model Factory] cuDNN warmup skipped: {e}", flush=True)
+
+
+    # 5. Return model and optimized parameters, grouped by dtype/device.
+    # Fused optimizers (optim.SGD/AdamW(..., fused=True) on CUDA) need
+    # homogeneous groups to step every parameter in a single kernel launch;
+    # torch optimizers accept this list of dicts wherever a flat parameter
+    # list was accepted before.
+    groups = collections.defaultdict(list)
+    for p in model.parameters():
+        if p.requires_grad:
+            groups[(p.dtype, p.device)].append(p)
+    parameters_to_optimize = [{'params': params} for params in groups.values()]
+
     return model, parameters_to_optimize
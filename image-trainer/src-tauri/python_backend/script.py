@@ -245,7 +245,12 @@ def main():
 
     try:
         criterion = nn.CrossEntropyLoss()
-        optimizer = optim.SGD(parameters_to_optimize, lr=args.learning_rate, momentum=0.9)
+        try:
+            # Fused SGD steps all CUDA parameters in one kernel launch.
+            optimizer = optim.SGD(parameters_to_optimize, lr=args.learning_rate, momentum=0.9,
+                                  fused=device.type == 'cuda')
+        except (TypeError, RuntimeError):
+            optimizer = optim.SGD(parameters_to_optimize, lr=args.learning_rate, momentum=0.9)
         
         num_epochs = args.epochs
         best_acc = 0.0
@@ -298,9 +303,10 @@ def main():
                     optimizer.zero_grad()
 
                     with torch.set_grad_enabled(phase == 'train'):
-                        outputs = model(inputs)
-                        _, preds = torch.max(outputs, 1)
-                        loss = criterion(outputs, labels)
+                        with model_factory.amp_context(device):
+                            outputs = model(inputs)
+                            _, preds = torch.max(outputs, 1)
+                            loss = criterion(outputs, labels)
 
                         if phase == 'train':
                             loss.backward()
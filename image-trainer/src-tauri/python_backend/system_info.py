@@ -1,42 +1,139 @@
-import torch
+import functools
+import importlib
 import platform
 import psutil
 import sys
 import json
 import os
+import tempfile
 
-def get_system_info():
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dumps(obj):
+    # orjson serializes several times faster; stdlib json is the fallback.
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+def _torch():
+    # Importing torch costs ~1-2s of CUDA/driver probing; defer it so the
+    # psutil/platform-only fields stay cheap for frequent UI refreshes.
+    return importlib.import_module("torch")
+
+def _torch_info():
+    # Set EPOQ_SKIP_TORCH_PROBE=1 to skip the torch import entirely when
+    # the caller only needs the hardware/platform fields.
+    if os.environ.get("EPOQ_SKIP_TORCH_PROBE"):
+        return None
+
+    torch = _torch()
+    cuda_available = torch.cuda.is_available()
+    return {
+        "version": torch.__version__,
+        "cuda_available": cuda_available,
+        "cuda_version": torch.version.cuda,
+        "gpu_name": torch.cuda.get_device_name(0) if cuda_available else None,
+    }
+
+# State carried between invocations: this script lives for one poll, so CPU
+# usage is computed from the delta against the previous run's snapshot.
+_CPU_STATE_FILE = os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(), 'epoq_cpu.json')
+
+# Smoothing factor for the usage EWMA; 0.5 follows the most recent sample
+# quickly while still damping single-poll spikes.
+_CPU_EWMA_ALPHA = 0.5
+
+def _cpu_usage_percent():
+    """
+    CPU usage smoothed across invocations of this script.
+
+    Diffs the aggregate CPU times against a snapshot written by the previous
+    run (psutil.cpu_times() works on every platform, unlike raw /proc/stat),
+    then folds the sample into an EWMA kept in the same state file. No
+    blocking sample interval is ever taken.
+    """
+    times = psutil.cpu_times()
+    # guest/guest_nice are already counted inside user/nice on Linux;
+    # subtract them like psutil's own total does.
+    total = (sum(times)
+             - getattr(times, 'guest', 0.0)
+             - getattr(times, 'guest_nice', 0.0))
+    busy = total - times.idle - getattr(times, 'iowait', 0.0)
+
+    percent = None
+    prev_ewma = None
+    try:
+        with open(_CPU_STATE_FILE) as f:
+            prev = json.load(f)
+        prev_ewma = prev.get('ewma')
+        busy_delta = busy - prev['busy']
+        total_delta = total - prev['total']
+        if total_delta > 0 and busy_delta >= 0:
+            percent = 100.0 * busy_delta / total_delta
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    if percent is None:
+        # First invocation (or stale/corrupt state): use the since-boot
+        # ratio from the times already read. A first-ever
+        # cpu_percent(interval=None) would only measure this process's own
+        # startup burst, and that bogus sample would seed the EWMA.
+        percent = 100.0 * busy / total if total > 0 else 0.0
+
+    ewma = percent if prev_ewma is None else (
+        _CPU_EWMA_ALPHA * percent + (1 - _CPU_EWMA_ALPHA) * prev_ewma)
+
+    try:
+        with open(_CPU_STATE_FILE, 'w') as f:
+            json.dump({'busy': busy, 'total': total, 'ewma': ewma}, f)
+    except OSError:
+        pass
+
+    return round(ewma, 1)
+
+@functools.lru_cache(maxsize=1)
+def _disk_usage():
+    # Anchor at the real filesystem root ('C:\\' on Windows instead of a
+    # literal '/') and cache the statvfs result for the process lifetime.
+    return psutil.disk_usage(os.path.abspath(os.sep))
+
+def get_system_info(basic=False):
     vm = psutil.virtual_memory()
-    cpu_percent = psutil.cpu_percent(interval=0.3)
-    disk = psutil.disk_usage('/')
 
-    info = {
-        "python": {
-            "version": sys.version.split()[0],
-            "executable": sys.executable,
-        },
-        "torch": {
-            "version": torch.__version__,
-            "cuda_available": torch.cuda.is_available(),
-            "cuda_version": torch.version.cuda,
-            "gpu_name": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
-        },
-        "hardware": {
-            "cpu": platform.processor(),
-            "architecture": platform.machine(),
-            "cores": psutil.cpu_count(logical=True),
-            "cpu_usage_percent": cpu_percent,
-            "cpu_freq_mhz": psutil.cpu_freq().current if psutil.cpu_freq() else None,
-
-            "ram_total_gb": round(vm.total / (1024**3), 2),
-            "ram_available_gb": round(vm.available / (1024**3), 2),
-            "ram_used_gb": round((vm.total - vm.available) / (1024**3), 2),
-            "ram_used_percent": vm.percent,
+    hardware = {
+        "cpu": platform.processor(),
+        "architecture": platform.machine(),
+        "cores": psutil.cpu_count(logical=True),
+
+        "ram_total_gb": round(vm.total / (1024**3), 2),
+        "ram_available_gb": round(vm.available / (1024**3), 2),
+        "ram_used_gb": round((vm.total - vm.available) / (1024**3), 2),
+        "ram_used_percent": vm.percent,
+    }
+
+    if not basic:
+        disk = _disk_usage()
+        freq = psutil.cpu_freq()
+        hardware.update({
+            "cpu_usage_percent": _cpu_usage_percent(),
+            "cpu_freq_mhz": freq.current if freq else None,
 
             "disk_total_gb": round(disk.total / (1024**3), 2),
             "disk_free_gb": round(disk.free / (1024**3), 2),
             "disk_used_percent": disk.percent,
+        })
+
+    info = {
+        "python": {
+            "version": sys.version.split()[0],
+            "executable": sys.executable,
         },
+        "torch": _torch_info(),
+        "hardware": hardware,
         "platform": {
             "os": platform.system(),
             "release": platform.release(),
@@ -44,8 +141,13 @@ def get_system_info():
         }
     }
 
-    print(json.dumps(info))
+    print(_dumps(info))
 
 
 if __name__ == "__main__":
-    get_system_info()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description='EPOQ system info probe')
+    parser.add_argument('--basic', action='store_true',
+                        help='Emit the minimal dict (skips CPU usage/freq and disk stats) for fast first-load polls')
+    args = parser.parse_args()
+    get_system_info(basic=args.basic)